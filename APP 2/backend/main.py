@@ -1,4 +1,4 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, UploadFile, File
 from pydantic import BaseModel
 from typing import List, Dict
 from fastapi.responses import JSONResponse
@@ -9,6 +9,7 @@ import json
 import ast
 import math
 import re
+import os
 from collections import deque
 
 
@@ -21,6 +22,17 @@ CELL_SIZE = 40  # pixels per grid cell
 # Default conversion factor - calibratable
 METERS_TO_GRID_FACTOR = 1.0  # 1 grid = 1 meter
 
+# Path-loss model defaults and per-beacon calibration
+DEFAULT_TX_POWER = -59
+DEFAULT_PATH_LOSS_EXPONENT = 2.0
+CALIBRATION_PATH = "beacon_calibration.json"
+CALIBRATION_CHUNK_SIZE = 100_000  # rows read per chunk from uploaded logs
+RSSI_TABLE_MIN = -127  # lowest RSSI (dBm) covered by the lookup tables
+RSSI_TABLE_MAX = 20
+MIN_PATH_LOSS_EXPONENT = 1.0  # plausible range for fitted exponents
+MAX_PATH_LOSS_EXPONENT = 6.0
+MIN_CALIBRATION_SAMPLES = 20  # fewer samples per beacon are skipped, not saved
+
 def load_booth_data(csv_path):
     df = pd.read_csv(csv_path)
     booths = []
@@ -208,7 +220,7 @@ class CalibrationRequest(BaseModel):
     known_distance_meters: float
 
 # Function to convert RSSI to physical distance in meters
-def rssi_to_distance(rssi: int, tx_power: int = -59, path_loss_exponent: float = 2.0) -> float:
+def rssi_to_distance(rssi: int, tx_power: int = DEFAULT_TX_POWER, path_loss_exponent: float = DEFAULT_PATH_LOSS_EXPONENT) -> float:
     """
     Convert RSSI value to physical distance in meters
 
@@ -222,6 +234,141 @@ def rssi_to_distance(rssi: int, tx_power: int = -59, path_loss_exponent: float =
     """
     return math.pow(10, (tx_power - rssi) / (10 * path_loss_exponent))
 
+def build_distance_table(tx_power: float, path_loss_exponent: float) -> np.ndarray:
+    """Precompute rssi_to_distance for every integer RSSI in [RSSI_TABLE_MIN, RSSI_TABLE_MAX]."""
+    rssi = np.arange(RSSI_TABLE_MIN, RSSI_TABLE_MAX + 1)
+    return np.power(10.0, (tx_power - rssi) / (10 * path_loss_exponent))
+
+def is_finite_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def is_plausible_exponent(exponent) -> bool:
+    return is_finite_number(exponent) and MIN_PATH_LOSS_EXPONENT <= exponent <= MAX_PATH_LOSS_EXPONENT
+
+def load_beacon_calibration(path):
+    """
+    Load saved per-beacon fits. A corrupt file or malformed entry is ignored
+    (falling back to the defaults) rather than stopping the backend from starting.
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            calibration = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Ignoring RSSI calibration file {path} — {e}")
+        return {}
+    if not isinstance(calibration, dict):
+        print(f"⚠️ Ignoring RSSI calibration file {path} — expected an object of beacons")
+        return {}
+
+    for beacon_id, params in list(calibration.items()):
+        if not isinstance(params, dict) or not is_finite_number(params.get("txPower")):
+            print(f"⚠️ Ignoring calibration for {beacon_id} — missing or invalid txPower")
+            del calibration[beacon_id]
+        elif not is_plausible_exponent(params.get("pathLossExponent")):
+            print(f"⚠️ Ignoring calibration for {beacon_id} — implausible path-loss exponent")
+            del calibration[beacon_id]
+    print(f"📡 Loaded RSSI calibration for {len(calibration)} beacons")
+    return calibration
+
+def save_beacon_calibration(path, calibration):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(calibration, f, indent=2)
+    os.replace(tmp_path, path)
+
+def build_distance_tables(calibration):
+    return {
+        beacon_id: build_distance_table(params["txPower"], params["pathLossExponent"])
+        for beacon_id, params in calibration.items()
+    }
+
+BEACON_CALIBRATION = load_beacon_calibration(CALIBRATION_PATH)
+DEFAULT_DISTANCE_TABLE = build_distance_table(DEFAULT_TX_POWER, DEFAULT_PATH_LOSS_EXPONENT)
+DISTANCE_TABLES = build_distance_tables(BEACON_CALIBRATION)
+
+def lookup_distance(beacon_id: str, rssi: int) -> float:
+    """Distance in meters for a reading, using the beacon's calibrated table if it has one."""
+    table = DISTANCE_TABLES.get(beacon_id, DEFAULT_DISTANCE_TABLE)
+    index = min(max(int(rssi), RSSI_TABLE_MIN), RSSI_TABLE_MAX) - RSSI_TABLE_MIN
+    return table[index]
+
+def normalize_beacon_id(uuid: str) -> str:
+    # Map Android MAC addresses to iOS beacon IDs
+    if ":" in uuid:
+        return MAC_TO_ID_MAP.get(uuid, uuid)
+    return uuid
+
+def accumulate_calibration_chunk(stats, chunk):
+    """
+    Add one chunk of (beacon, distance_meters, rssi) samples to per-beacon sums.
+
+    The path-loss model rssi = tx_power - 10 * n * log10(d) is linear in
+    u = -10 * log10(d), so least squares only needs count, sum(u), sum(u^2),
+    sum(rssi) and sum(u * rssi) per beacon.
+    """
+    chunk = chunk[["beacon", "distance_meters", "rssi"]].copy()
+    # Non-numeric values become NaN and are dropped with the other incomplete rows
+    chunk["distance_meters"] = pd.to_numeric(chunk["distance_meters"], errors="coerce")
+    chunk["rssi"] = pd.to_numeric(chunk["rssi"], errors="coerce")
+    chunk = chunk.dropna()
+    chunk = chunk[chunk["distance_meters"] > 0]
+    if chunk.empty:
+        return
+    beacon = chunk["beacon"].astype(str).str.strip().map(normalize_beacon_id)
+    u = -10 * np.log10(chunk["distance_meters"].to_numpy(dtype=float))
+    r = chunk["rssi"].to_numpy(dtype=float)
+
+    sums = pd.DataFrame({"beacon": beacon.to_numpy(), "n": 1.0, "u": u, "uu": u * u, "r": r, "ur": u * r})
+    sums = sums.groupby("beacon").sum()
+    for beacon_id, row in sums.iterrows():
+        acc = stats.setdefault(beacon_id, np.zeros(5))
+        acc += row[["n", "u", "uu", "r", "ur"]].to_numpy()
+
+def fit_calibration(stats):
+    """
+    Solve the per-beacon least-squares fit from accumulated sums.
+
+    Returns (fitted, skipped); beacons with fewer than MIN_CALIBRATION_SAMPLES
+    samples or an exponent outside [MIN_PATH_LOSS_EXPONENT, MAX_PATH_LOSS_EXPONENT]
+    are skipped with a reason. When every sample was taken at one distance only
+    tx power is fitted, and the entry is marked "exponentFitted": False.
+    """
+    fitted = {}
+    skipped = {}
+    for beacon_id, (n, su, suu, sr, sur) in stats.items():
+        if n < MIN_CALIBRATION_SAMPLES:
+            skipped[beacon_id] = {
+                "reason": f"only {int(n)} samples, need at least {MIN_CALIBRATION_SAMPLES}",
+                "samples": int(n),
+            }
+            continue
+        var_u = suu - su * su / n
+        exponent_fitted = var_u > 1e-9
+        if exponent_fitted:
+            exponent = (sur - su * sr / n) / var_u
+            tx_power = (sr - exponent * su) / n
+        else:
+            # All samples at one distance: only tx power is identifiable
+            exponent = DEFAULT_PATH_LOSS_EXPONENT
+            tx_power = (sr - exponent * su) / n
+        # Check before rounding so a tiny exponent can't round to 0.0
+        if not is_plausible_exponent(float(exponent)):
+            skipped[beacon_id] = {
+                "reason": f"path-loss exponent {float(exponent):.3g} outside "
+                          f"{MIN_PATH_LOSS_EXPONENT}-{MAX_PATH_LOSS_EXPONENT}",
+                "samples": int(n),
+            }
+            continue
+        fitted[beacon_id] = {
+            "txPower": round(float(tx_power), 2),
+            "pathLossExponent": round(float(exponent), 3),
+            "exponentFitted": bool(exponent_fitted),
+            "samples": int(n),
+        }
+    return fitted, skipped
+
 # ====== API ======
 @app.post("/locate")
 def locate_user(data: BLEScan):
@@ -231,14 +378,12 @@ def locate_user(data: BLEScan):
 
     for reading in data.ble_data:
         # Check if the UUID is a MAC address and map it if necessary
-        beacon_id = reading.uuid
-        if ":" in reading.uuid:  # This is likely a MAC address
-            beacon_id = MAC_TO_ID_MAP.get(reading.uuid, reading.uuid)
+        beacon_id = normalize_beacon_id(reading.uuid)
 
         pos = BEACON_POSITIONS.get(beacon_id)
         if pos:
-            # Convert RSSI to distance in meters
-            distance_meters = rssi_to_distance(reading.rssi)
+            # Convert RSSI to distance in meters (per-beacon calibrated lookup)
+            distance_meters = lookup_distance(beacon_id, reading.rssi)
             # Convert weight based on physical distance (inverse square law)
             weight = 1 / max(0.1, distance_meters ** 2)
 
@@ -368,7 +513,9 @@ def get_config():
         "beaconIdMapping": BEACON_MAC_MAP,
         "gridCellSize": CELL_SIZE,  # pixels per grid cell
         "metersToGridFactor": METERS_TO_GRID_FACTOR,  # conversion factor for physical distance
-        "txPower": -59  # Default reference RSSI at 1m
+        "txPower": DEFAULT_TX_POWER,  # Default reference RSSI at 1m
+        "pathLossExponent": DEFAULT_PATH_LOSS_EXPONENT,
+        "beaconCalibration": BEACON_CALIBRATION,  # per-beacon overrides
     }
 
 @app.post("/calibrate")
@@ -393,7 +540,7 @@ def calibrate_system(data: CalibrationRequest):
     # Calculate grid distance between beacons
     dx = beacon2_pos[0] - beacon1_pos[0]
     dy = beacon2_pos[1] - beacon1_pos[1]
-    grid_distance = math.sqrt(dx*2 + dy*2)
+    grid_distance = math.sqrt(dx**2 + dy**2)
 
     # Ensure we have a valid physical distance
     if data.known_distance_meters <= 0:
@@ -406,16 +553,62 @@ def calibrate_system(data: CalibrationRequest):
     new_factor = grid_distance / data.known_distance_meters
 
     # Update the global factor
+    previous_factor = METERS_TO_GRID_FACTOR
     METERS_TO_GRID_FACTOR = new_factor
 
     return {
         "success": True,
-        "previousFactor": METERS_TO_GRID_FACTOR,
+        "previousFactor": previous_factor,
         "newFactor": new_factor,
         "gridDistance": grid_distance,
         "physicalDistance": data.known_distance_meters
     }
 
+@app.post("/calibrate/rssi")
+def calibrate_rssi(file: UploadFile = File(...)):
+    """
+    Fit per-beacon tx power and path-loss exponent from a calibration log
+
+    The upload is a CSV with beacon, distance_meters and rssi columns. It is read
+    in chunks so large logs never have to fit in memory. Fitted parameters are
+    merged into the saved calibration and used by /locate immediately; beacons
+    with an implausible fitted exponent are reported under "skipped" and not saved.
+    """
+    global DISTANCE_TABLES
+
+    stats = {}
+    try:
+        for chunk in pd.read_csv(file.file, chunksize=CALIBRATION_CHUNK_SIZE):
+            accumulate_calibration_chunk(stats, chunk)
+    except (KeyError, ValueError, pd.errors.ParserError) as e:
+        return JSONResponse(
+            content={"error": f"Could not read calibration log: {e}"},
+            status_code=400
+        )
+
+    if not stats:
+        return JSONResponse(
+            content={"error": "No valid calibration samples found"},
+            status_code=400
+        )
+
+    fitted, skipped = fit_calibration(stats)
+    for beacon_id, info in skipped.items():
+        print(f"⚠️ Skipping calibration for {beacon_id} — {info['reason']}")
+
+    if not fitted:
+        return JSONResponse(
+            content={"error": "No beacon produced a plausible fit", "skipped": skipped},
+            status_code=400
+        )
+
+    BEACON_CALIBRATION.update(fitted)
+    save_beacon_calibration(CALIBRATION_PATH, BEACON_CALIBRATION)
+    DISTANCE_TABLES = build_distance_tables(BEACON_CALIBRATION)
+
+    print(f"📡 Calibrated {len(fitted)} beacons from {sum(p['samples'] for p in fitted.values())} samples")
+    return {"success": True, "beacons": fitted, "skipped": skipped}
+
 # ====== A* Algorithm ======
 def is_inside_area(x, y, areas):
     for area in areas:
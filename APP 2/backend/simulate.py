@@ -0,0 +1,252 @@
+"""
+Offline localization-accuracy simulator.
+
+Generates synthetic RSSI for every walkable cell of the venue grid, runs the
+same weighted-centroid estimate as /locate over batches of cells and Monte
+Carlo trials at once, and reports per-cell error heatmaps and summary
+percentiles. Beacons with a saved RSSI calibration use their fitted tx power
+and path-loss exponent, as /locate does.
+
+Usage:
+    python simulate.py --trials 200 --noise 4 --dropout 0.1 --out heatmap.csv
+    python simulate.py --layout candidate.json --floor-height 40
+
+A --layout file holds Setup Platform beacon positions (the output of
+compute_edge_aligned_beacon_positions): meters with y pointing up, as a JSON
+list of [x, y] pairs or {"x": .., "y": ..} objects, or a CSV with x and y
+columns.
+"""
+import argparse
+import csv
+import json
+import warnings
+import numpy as np
+
+import main as backend
+
+# Upper bound on (trials x cells x beacons) readings held in memory at once
+BATCH_READINGS = 2_000_000
+
+
+def distance_to_rssi(distance_meters, tx_power=backend.DEFAULT_TX_POWER, path_loss_exponent=backend.DEFAULT_PATH_LOSS_EXPONENT):
+    """
+    Inverse of rssi_to_distance: expected RSSI (dBm) at the given distance(s).
+    """
+    distance_meters = np.maximum(distance_meters, 0.01)
+    return tx_power - 10 * path_loss_exponent * np.log10(distance_meters)
+
+
+def rssi_to_distance_array(rssi, tx_power=backend.DEFAULT_TX_POWER, path_loss_exponent=backend.DEFAULT_PATH_LOSS_EXPONENT):
+    """
+    Vectorized rssi_to_distance for NumPy arrays of readings.
+    """
+    return np.power(10.0, (tx_power - rssi) / (10 * path_loss_exponent))
+
+
+def walkable_mask(grid_shape, walkable_zones):
+    """
+    Boolean (rows, cols) mask of cells inside any walkable zone (same rule as is_inside_area).
+    """
+    rows, cols = grid_shape
+    mask = np.zeros((rows, cols), dtype=bool)
+    for area in walkable_zones:
+        sx, sy = area["start"]
+        ex, ey = area["end"]
+        min_x, max_x = max(min(sx, ex), 0), min(max(sx, ex), cols - 1)
+        min_y, max_y = max(min(sy, ey), 0), min(max(sy, ey), rows - 1)
+        mask[min_y:max_y + 1, min_x:max_x + 1] = True
+    return mask
+
+
+def load_layout(path):
+    """Read Setup Platform beacon positions (meters, y up) from a JSON or CSV file."""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="") as f:
+            return [(float(row["x"]), float(row["y"])) for row in csv.DictReader(f)]
+    with open(path) as f:
+        data = json.load(f)
+    return [(float(p["x"]), float(p["y"])) if isinstance(p, dict) else (float(p[0]), float(p[1]))
+            for p in data]
+
+
+def layout_to_grid(positions_m, floor_height_m, meters_to_grid):
+    """
+    Convert Setup Platform positions (meters, origin bottom-left, y up) to grid
+    cells (origin top-left, y down) using meters_to_grid cells per meter.
+    """
+    return [(x * meters_to_grid, (floor_height_m - y) * meters_to_grid) for x, y in positions_m]
+
+
+def beacon_model_params(beacon_ids, calibration, tx_power=backend.DEFAULT_TX_POWER,
+                        path_loss_exponent=backend.DEFAULT_PATH_LOSS_EXPONENT):
+    """
+    (B,) tx power and path-loss exponent arrays, taken from calibration where a
+    beacon has been fitted and from the given defaults otherwise.
+    """
+    tx = np.array([calibration.get(b, {}).get("txPower", tx_power) for b in beacon_ids], dtype=float)
+    exponent = np.array([calibration.get(b, {}).get("pathLossExponent", path_loss_exponent)
+                         for b in beacon_ids], dtype=float)
+    return tx, exponent
+
+
+def weighted_centroid(beacon_xy, rssi, tx_power=backend.DEFAULT_TX_POWER, path_loss_exponent=backend.DEFAULT_PATH_LOSS_EXPONENT):
+    """
+    Batched version of the /locate estimate.
+
+    Args:
+        beacon_xy: (B, 2) beacon grid positions
+        rssi: (..., B) readings, NaN where a beacon was not heard
+        tx_power, path_loss_exponent: scalars or (B,) per-beacon arrays
+
+    Returns:
+        (..., 2) rounded grid estimates, NaN where no beacon was heard
+    """
+    # /locate clamps readings to its lookup-table range
+    distance = rssi_to_distance_array(np.clip(rssi, backend.RSSI_TABLE_MIN, backend.RSSI_TABLE_MAX),
+                                      tx_power, path_loss_exponent)
+    weight = 1 / np.maximum(0.1, distance ** 2)
+    weight = np.where(np.isnan(rssi), 0.0, weight)
+
+    total_weight = weight.sum(axis=-1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        estimate = (weight @ beacon_xy) / total_weight
+    estimate[np.broadcast_to(total_weight == 0, estimate.shape)] = np.nan
+    return np.round(estimate)
+
+
+ALGORITHMS = {
+    "weighted_centroid": weighted_centroid,
+}
+
+
+def simulate_layout(beacon_positions, mask, trials=100, noise_db=4.0, dropout=0.1,
+                    meters_to_grid=1.0, tx_power=backend.DEFAULT_TX_POWER,
+                    path_loss_exponent=backend.DEFAULT_PATH_LOSS_EXPONENT,
+                    algorithm="weighted_centroid", seed=None, batch_readings=BATCH_READINGS,
+                    calibration=None):
+    """
+    Simulate localization error for one beacon layout.
+
+    Args:
+        beacon_positions: dict of id -> (x, y) or sequence of (x, y), in grid cells
+        mask: (rows, cols) boolean mask of cells to evaluate
+        trials: Monte Carlo trials per cell
+        noise_db: standard deviation of Gaussian RSSI noise (dBm)
+        dropout: probability that a single reading is missed
+        meters_to_grid: grid cells per meter (METERS_TO_GRID_FACTOR)
+        tx_power, path_loss_exponent: scalars or (B,) per-beacon arrays; when
+            beacon_positions is a dict, calibrated beacons override them
+        calibration: per-beacon fits keyed by beacon ID (default backend.BEACON_CALIBRATION)
+        batch_readings: max readings simulated per batch; caps peak memory
+
+    Returns:
+        dict with "mean_error" and "p90_error" heatmaps (meters, NaN outside the
+        mask), "no_fix_rate" heatmap and overall error "percentiles"
+    """
+    if isinstance(beacon_positions, dict):
+        beacon_ids = list(beacon_positions)
+        beacon_positions = list(beacon_positions.values())
+        tx_power, path_loss_exponent = beacon_model_params(
+            beacon_ids, backend.BEACON_CALIBRATION if calibration is None else calibration,
+            tx_power, path_loss_exponent)
+    beacon_xy = np.asarray(beacon_positions, dtype=float).reshape(-1, 2)
+    rng = np.random.default_rng(seed)
+
+    cell_y, cell_x = np.nonzero(mask)
+    cells = np.stack([cell_x, cell_y], axis=1).astype(float)  # (C, 2)
+
+    # True distance from every cell to every beacon, in meters: (C, B)
+    grid_distance = np.linalg.norm(cells[:, None, :] - beacon_xy[None, :, :], axis=-1)
+    expected_rssi = distance_to_rssi(grid_distance / meters_to_grid, tx_power, path_loss_exponent)
+
+    # Simulate in (trials x cells) batches so the (T, C, B) reading arrays stay
+    # under batch_readings; only the (T, C) error samples are kept
+    n_cells, n_beacons = expected_rssi.shape
+    cell_batch = max(1, min(n_cells, batch_readings // max(1, n_beacons)))
+    trial_batch = max(1, batch_readings // (cell_batch * max(1, n_beacons)))
+    locate = ALGORITHMS[algorithm]
+    error = np.empty((trials, n_cells), dtype=np.float32)
+
+    for c0 in range(0, n_cells, cell_batch):
+        c1 = min(c0 + cell_batch, n_cells)
+        for t0 in range(0, trials, trial_batch):
+            t1 = min(t0 + trial_batch, trials)
+            shape = (t1 - t0, c1 - c0, n_beacons)
+            rssi = np.round(expected_rssi[c0:c1] + rng.normal(0.0, noise_db, shape))
+            rssi[rng.random(shape) < dropout] = np.nan
+
+            estimate = locate(beacon_xy, rssi, tx_power, path_loss_exponent)  # (t, c, 2)
+            error[t0:t1, c0:c1] = np.linalg.norm(estimate - cells[None, c0:c1, :], axis=-1) / meters_to_grid
+
+    no_fix = np.isnan(error)
+    with warnings.catch_warnings():
+        # Cells that never got a fix produce all-NaN slices
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean_error = np.nanmean(error, axis=0)
+        p90_error = np.nanpercentile(error, 90, axis=0)
+
+    def to_heatmap(values):
+        heatmap = np.full(mask.shape, np.nan)
+        heatmap[cell_y, cell_x] = values
+        return heatmap
+
+    fixed = error[~no_fix]
+    percentiles = {
+        f"p{p}": float(np.percentile(fixed, p)) if fixed.size else float("nan")
+        for p in (50, 75, 90, 95)
+    }
+    return {
+        "mean_error": to_heatmap(mean_error),
+        "p90_error": to_heatmap(p90_error),
+        "no_fix_rate": to_heatmap(no_fix.mean(axis=0)),
+        "percentiles": percentiles,
+        "no_fix_rate_overall": float(no_fix.mean()) if no_fix.size else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate localization accuracy for the venue beacon layout")
+    parser.add_argument("--trials", type=int, default=100)
+    parser.add_argument("--noise", type=float, default=4.0, help="RSSI noise std dev (dBm)")
+    parser.add_argument("--dropout", type=float, default=0.1, help="probability a reading is missed")
+    parser.add_argument("--algorithm", choices=sorted(ALGORITHMS), default="weighted_centroid")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", default=None, help="write the mean-error heatmap to this CSV")
+    parser.add_argument("--layout", default=None,
+                        help="JSON/CSV of Setup Platform beacon positions in meters (default: BEACON_POSITIONS)")
+    parser.add_argument("--floor-height", type=float, default=None,
+                        help="floor height in meters for --layout (default: grid rows / METERS_TO_GRID_FACTOR)")
+    args = parser.parse_args()
+
+    grid_shape = np.array(backend.VENUE_GRID).shape
+    mask = walkable_mask(grid_shape, backend.WALKABLE_ZONES)
+    if args.layout:
+        floor_height = args.floor_height
+        if floor_height is None:
+            floor_height = grid_shape[0] / backend.METERS_TO_GRID_FACTOR
+        layout = layout_to_grid(load_layout(args.layout), floor_height, backend.METERS_TO_GRID_FACTOR)
+        layout_name = f"{len(layout)} beacons from {args.layout}"
+    else:
+        layout = backend.BEACON_POSITIONS
+        calibrated = sum(1 for b in layout if b in backend.BEACON_CALIBRATION)
+        layout_name = f"{len(layout)} beacons ({calibrated} calibrated)"
+
+    result = simulate_layout(
+        layout, mask,
+        trials=args.trials, noise_db=args.noise, dropout=args.dropout,
+        meters_to_grid=backend.METERS_TO_GRID_FACTOR,
+        algorithm=args.algorithm, seed=args.seed,
+    )
+
+    print(f"📊 {int(mask.sum())} walkable cells x {args.trials} trials, {layout_name}")
+    for name, value in result["percentiles"].items():
+        print(f"   {name} error: {value:.2f} m")
+    print(f"   no fix: {result['no_fix_rate_overall']:.1%}")
+
+    if args.out:
+        np.savetxt(args.out, result["mean_error"], delimiter=",", fmt="%.3f")
+        print(f"✅ Mean-error heatmap written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
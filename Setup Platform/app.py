@@ -40,21 +40,59 @@
 # if __name__ == '__main__':
 #     app.run(debug=True)
 
-from flask import Flask, render_template, request, url_for
+from flask import Flask, render_template, request, url_for, jsonify, send_from_directory, abort
 import os
 import math
+import re
+import json
+import time
+import uuid
+import threading
+import multiprocessing
+from collections import deque
+import matplotlib
+matplotlib.use('Agg')  # render off-screen; jobs run in worker processes
 import matplotlib.pyplot as plt
 import matplotlib.image as mpimg
 from matplotlib.patches import Circle, Rectangle
+from PIL import Image
+import numpy as np
 from werkzeug.utils import secure_filename
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
+app.config['TILE_FOLDER'] = 'static/uploads/tiles'
 
 # Create the upload folder if it doesn't exist
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
 
+# Background render queue settings
+MAX_RENDER_WORKERS = 2      # concurrent placement/render jobs
+RENDER_JOB_TIMEOUT = 120    # seconds a single job may run before its worker is killed
+RENDER_POLL_INTERVAL = 0.5  # seconds between watchdog checks
+
+# Workers are spawned, not forked: the Flask process has the watchdog and
+# request threads running, and forking it can copy a held lock into the child
+render_mp_context = multiprocessing.get_context('spawn')
+ARTIFACT_TTL = 60 * 60      # seconds finished uploads and annotated images are kept on disk
+CLEANUP_INTERVAL = 60       # seconds between artifact sweeps
+# Names index() gives uploads and their annotated copies; other files in
+# static/uploads (e.g. the sample floorplans in the repo) are never swept
+RENDER_UPLOAD_PATTERN = re.compile(r'^(annotated_)?[0-9a-f]{8}_')
+
+# Tile pyramid settings. Tile sets are the published map for the navigation
+# apps, so they are not part of ARTIFACT_TTL cleanup: they stay on disk (and
+# listed under /tiles) until someone deletes the directory by hand.
+TILE_SIZE = 256
+TILE_CACHE_SECONDS = 365 * 24 * 60 * 60  # tile URLs are unique per upload
+TILE_META_FILENAME = 'meta.json'
+
+render_watchdog = None
+render_jobs = {}
+render_queue = deque()
+render_jobs_lock = threading.Lock()
+
 def compute_edge_aligned_beacon_positions(width, height, r):
     dx = math.sqrt(3) * r
     dy = 1.5 * r
@@ -91,6 +129,7 @@ def visualize_edge_aligned_beacons(width, height, positions, floorplan_path, out
     """
     Visualize beacon placement using the final annotated floorplan as background.
     """
+    fig = None
     try:
         img = mpimg.imread(floorplan_path)
         
@@ -114,10 +153,334 @@ def visualize_edge_aligned_beacons(width, height, positions, floorplan_path, out
 
         plt.subplots_adjust(left=0, right=1, top=1, bottom=0)
         plt.savefig(output_path, bbox_inches='tight', pad_inches=0)
-        plt.close(fig)
         
     except FileNotFoundError:
         print(f"Image file not found: {floorplan_path}")
+    finally:
+        if fig is not None:
+            plt.close(fig)
+
+def _halve_rows(rows):
+    """
+    2x2 box-downsample an (h, w, 4) uint8 array. An odd last row or column is
+    averaged with itself, so edges keep the colour of the pixels they have.
+    """
+    a = rows.astype(np.uint16)
+    if a.shape[1] % 2:
+        a = np.concatenate([a, a[:, -1:]], axis=1)
+    if a.shape[0] % 2:
+        a = np.concatenate([a, a[-1:]], axis=0)
+    return ((a[0::2, 0::2] + a[1::2, 0::2] + a[0::2, 1::2] + a[1::2, 1::2] + 2) // 4).astype(np.uint8)
+
+def build_tile_pyramid(image_path, tiles_dir, tile_size=TILE_SIZE):
+    """
+    Cut an image into a zoom-level pyramid of tile_size x tile_size PNG tiles.
+
+    The highest level is full resolution; each lower level halves the previous
+    one until the whole image fits in a single tile. The source is read in
+    bands of tile_size rows and every level is built in the same pass: each
+    band is tiled, halved and handed to the level below, so only a few rows
+    per level are held at once instead of a full copy of every level.
+    Pillow still decodes the source file in one piece, so the decoded image
+    is the memory floor.
+
+    Tiles are written to tiles_dir/<level>/<col>_<row>.png. Right and bottom
+    edge tiles are padded with transparency so every tile is tile_size square.
+    The pyramid size is written to tiles_dir/meta.json.
+    """
+    source = Image.open(image_path)
+    full_width, full_height = source.size
+
+    max_level = 0
+    while max(full_width, full_height) > tile_size * (2 ** max_level):
+        max_level += 1
+
+    def level_width(level):
+        return math.ceil(full_width / 2 ** (max_level - level))
+
+    # Rows waiting to become a full row of tiles, and rows waiting to be halved
+    pending_tiles = {level: np.empty((0, level_width(level), 4), np.uint8) for level in range(max_level + 1)}
+    pending_halve = {level: np.empty((0, level_width(level), 4), np.uint8) for level in range(max_level + 1)}
+    tile_rows_written = {level: 0 for level in range(max_level + 1)}
+
+    def write_tile_row(level, rows):
+        level_dir = os.path.join(tiles_dir, str(level))
+        os.makedirs(level_dir, exist_ok=True)
+        row = tile_rows_written[level]
+        for col in range(math.ceil(rows.shape[1] / tile_size)):
+            tile = rows[:, col * tile_size:(col + 1) * tile_size]
+            if tile.shape[:2] != (tile_size, tile_size):
+                padded = np.zeros((tile_size, tile_size, 4), np.uint8)
+                padded[:tile.shape[0], :tile.shape[1]] = tile
+                tile = padded
+            Image.fromarray(tile, 'RGBA').save(os.path.join(level_dir, f'{col}_{row}.png'))
+        tile_rows_written[level] += 1
+
+    def push_rows(level, rows, final=False):
+        tiles = np.concatenate([pending_tiles[level], rows])
+        while len(tiles) >= tile_size:
+            write_tile_row(level, tiles[:tile_size])
+            tiles = tiles[tile_size:]
+        if final and len(tiles):
+            write_tile_row(level, tiles)
+            tiles = tiles[:0]
+        pending_tiles[level] = tiles
+
+        if level == 0:
+            return
+        # Halve an even number of rows; keep an odd leftover for the next band
+        halve = np.concatenate([pending_halve[level], rows])
+        ready = len(halve) if final else len(halve) - len(halve) % 2
+        pending_halve[level] = halve[ready:]
+        if ready:
+            push_rows(level - 1, _halve_rows(halve[:ready]), final)
+        elif final:
+            push_rows(level - 1, pending_halve[level - 1][:0], final)
+
+    for top in range(0, full_height, tile_size):
+        band = source.crop((0, top, full_width, min(top + tile_size, full_height))).convert('RGBA')
+        push_rows(max_level, np.asarray(band), final=top + tile_size >= full_height)
+
+    meta = {
+        'width': full_width,
+        'height': full_height,
+        'tile_size': tile_size,
+        'max_level': max_level,
+    }
+    with open(os.path.join(tiles_dir, TILE_META_FILENAME), 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+def run_render_job(floor_width, floor_height, file_path, annotated_path, tiles_dir):
+    """
+    Worker-process entry point: place beacons, render the annotated floorplan
+    and tile it for the navigation apps.
+
+    A tiling failure does not fail the job; the annotated image is still
+    delivered and the error is returned alongside it.
+    """
+    positions = compute_edge_aligned_beacon_positions(floor_width, floor_height, r=15)
+    visualize_edge_aligned_beacons(floor_width, floor_height, positions, file_path, annotated_path)
+    if not os.path.exists(annotated_path):
+        raise RuntimeError("Annotated image was not created")
+    try:
+        tiles, tiles_error = build_tile_pyramid(annotated_path, tiles_dir), None
+    except Exception as e:
+        print(f"Tiling failed for {annotated_path}: {e}")
+        tiles, tiles_error = None, str(e) or type(e).__name__
+    return len(positions), tiles, tiles_error
+
+def _render_worker(conn, job_args):
+    try:
+        conn.send(('done', run_render_job(*job_args)))
+    except Exception as e:
+        conn.send(('failed', str(e) or type(e).__name__))
+    finally:
+        conn.close()
+
+def _finish_render_job(job, status, result):
+    job['status'] = status
+    job['finished_at'] = time.time()
+    if status == 'done':
+        job['beacon_count'], job['tiles'], job['tiles_error'] = result
+    else:
+        job['error'] = result
+    job['conn'].close()
+    job['process'] = job['conn'] = None
+
+def _reap_render_jobs():
+    """Collect results of finished workers and kill the ones past RENDER_JOB_TIMEOUT."""
+    now = time.time()
+    for job in render_jobs.values():
+        if job['status'] != 'running':
+            continue
+        process, conn = job['process'], job['conn']
+        # Check the pipe again after is_alive() in case the worker exited right after sending
+        if conn.poll() or (not process.is_alive() and conn.poll()):
+            try:
+                status, result = conn.recv()
+            except EOFError:
+                status, result = 'failed', 'Render worker exited unexpectedly'
+            process.join()
+            _finish_render_job(job, status, result)
+        elif not process.is_alive():
+            _finish_render_job(job, 'failed', 'Render worker exited unexpectedly')
+        elif now - job['started_at'] > RENDER_JOB_TIMEOUT:
+            process.terminate()
+            process.join(timeout=1)
+            if process.is_alive():
+                process.kill()
+                process.join()
+            _finish_render_job(job, 'failed', f'Rendering timed out after {RENDER_JOB_TIMEOUT} seconds')
+
+def _start_queued_render_jobs():
+    running = sum(1 for job in render_jobs.values() if job['status'] == 'running')
+    while render_queue and running < MAX_RENDER_WORKERS:
+        job = render_jobs.get(render_queue.popleft())
+        if job is None:
+            continue
+        parent_conn, child_conn = render_mp_context.Pipe(duplex=False)
+        process = render_mp_context.Process(target=_render_worker, args=(child_conn, job['args']), daemon=True)
+        process.start()
+        child_conn.close()
+        job.update(status='running', started_at=time.time(), process=process, conn=parent_conn)
+        running += 1
+
+def _watch_render_jobs():
+    last_cleanup = 0
+    while True:
+        with render_jobs_lock:
+            _reap_render_jobs()
+            _start_queued_render_jobs()
+        if time.time() - last_cleanup > CLEANUP_INTERVAL:
+            cleanup_render_artifacts()
+            last_cleanup = time.time()
+        time.sleep(RENDER_POLL_INTERVAL)
+
+def start_render_watchdog():
+    """
+    Start the thread that launches queued jobs, enforces the per-job deadline
+    and sweeps old artifacts every CLEANUP_INTERVAL.
+
+    Each job runs in its own process so the watchdog can kill it even when it
+    is stuck inside PIL or Agg C code, on any platform.
+    """
+    global render_watchdog
+    if render_watchdog is None:
+        render_watchdog = threading.Thread(target=_watch_render_jobs, daemon=True)
+        render_watchdog.start()
+
+def enqueue_render_job(floor_width, floor_height, file_path, annotated_path):
+    """
+    Queue beacon placement and rendering for an uploaded floorplan and return its job ID.
+    """
+    job_id = uuid.uuid4().hex
+    annotated_filename = os.path.basename(annotated_path)
+    tiles_dir = os.path.join(app.config['TILE_FOLDER'], os.path.splitext(annotated_filename)[0])
+    with render_jobs_lock:
+        render_jobs[job_id] = {
+            'status': 'queued',
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'args': (floor_width, floor_height, file_path, annotated_path, tiles_dir),
+            'process': None,
+            'conn': None,
+            'files': [file_path, annotated_path],
+            'tiles_dir': tiles_dir,
+            'annotated_filename': annotated_filename,
+            'tiles': None,
+            'tiles_error': None,
+            'error': None,
+        }
+        render_queue.append(job_id)
+
+    start_render_watchdog()
+    return job_id
+
+def cleanup_render_artifacts(now=None):
+    """
+    Delete uploads and annotated images of jobs that finished more than ARTIFACT_TTL ago.
+    Their tile sets are kept (see TILE_SIZE settings).
+
+    Job files left on disk by an earlier run of the server (restart or debug
+    reload) are not in render_jobs, so they are removed by modification time.
+    """
+    now = now or time.time()
+    with render_jobs_lock:
+        expired = [job_id for job_id, job in render_jobs.items()
+                   if job['finished_at'] and now - job['finished_at'] > ARTIFACT_TTL]
+        expired_jobs = [render_jobs.pop(job_id) for job_id in expired]
+        in_use = {path for job in render_jobs.values() for path in job['files']}
+
+    for job in expired_jobs:
+        for path in job['files']:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    upload_folder = app.config['UPLOAD_FOLDER']
+    for name in os.listdir(upload_folder):
+        path = os.path.join(upload_folder, name)
+        if not RENDER_UPLOAD_PATTERN.match(name) or path in in_use or not os.path.isfile(path):
+            continue
+        try:
+            if now - os.path.getmtime(path) > ARTIFACT_TTL:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+@app.before_request
+def ensure_render_watchdog():
+    # Also starts the cleanup sweep after a restart, before any new upload
+    start_render_watchdog()
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    with render_jobs_lock:
+        job = render_jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        status = job['status']
+        response = {'job_id': job_id, 'status': status}
+        if status == 'done':
+            response['image_url'] = url_for('static', filename='uploads/' + job['annotated_filename'])
+            response['beacon_count'] = job['beacon_count']
+            tile_set = os.path.basename(job['tiles_dir'])
+            if job['tiles'] is None:
+                response['tiles_error'] = job['tiles_error']
+            else:
+                response['tiles'] = dict(job['tiles'], tile_set=tile_set,
+                                         url_template=tile_url_template(tile_set),
+                                         meta_url=url_for('tile_set_meta', tile_set=tile_set))
+        elif status == 'failed':
+            response['error'] = job['error']
+    return jsonify(response)
+
+def tile_url_template(tile_set):
+    return url_for('serve_tile', tile_set=tile_set, level=0, col=0, row=0).replace(
+        '/0/0/0.png', '/{z}/{x}/{y}.png')
+
+def load_tile_set_meta(tile_set):
+    if secure_filename(tile_set) != tile_set:
+        return None
+    try:
+        with open(os.path.join(app.config['TILE_FOLDER'], tile_set, TILE_META_FILENAME)) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return dict(meta, tile_set=tile_set, url_template=tile_url_template(tile_set))
+
+@app.route('/tiles')
+def list_tile_sets():
+    """Every published tile set, newest first, so clients can find one without a job ID."""
+    tile_folder = app.config['TILE_FOLDER']
+    names = os.listdir(tile_folder) if os.path.isdir(tile_folder) else []
+    names.sort(key=lambda name: os.path.getmtime(os.path.join(tile_folder, name)), reverse=True)
+    tile_sets = []
+    for name in names:
+        meta = load_tile_set_meta(name)
+        if meta is not None:
+            tile_sets.append(dict(meta, meta_url=url_for('tile_set_meta', tile_set=name)))
+    return jsonify({'tile_sets': tile_sets})
+
+@app.route('/tiles/<tile_set>/meta.json')
+def tile_set_meta(tile_set):
+    meta = load_tile_set_meta(tile_set)
+    if meta is None:
+        abort(404)
+    return jsonify(meta)
+
+@app.route('/tiles/<tile_set>/<int:level>/<int:col>/<int:row>.png')
+def serve_tile(tile_set, level, col, row):
+    if secure_filename(tile_set) != tile_set:
+        abort(404)
+    level_dir = os.path.join(app.config['TILE_FOLDER'], tile_set, str(level))
+    response = send_from_directory(level_dir, f'{col}_{row}.png', max_age=TILE_CACHE_SECONDS)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -134,20 +497,21 @@ def index():
         file = request.files.get('floorplan_image')
         if file:
             # Save original image
-            filename = secure_filename(file.filename)
+            # Prefix with a random token so concurrent uploads never share files
+            filename = uuid.uuid4().hex[:8] + '_' + secure_filename(file.filename)
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             file.save(file_path)
             
-            # Generate beacon positions and create annotated image
-            positions = compute_edge_aligned_beacon_positions(floor_width, floor_height, r=15)
+            # Queue beacon placement and rendering; the page polls /jobs/<id>
             annotated_filename = 'annotated_' + filename
             annotated_path = os.path.join(app.config['UPLOAD_FOLDER'], annotated_filename)
-            visualize_edge_aligned_beacons(floor_width, floor_height, positions, file_path, annotated_path)
-            
-            # Use the annotated image for display
-            display_image = url_for('static', filename='uploads/' + annotated_filename)
+            job_id = enqueue_render_job(floor_width, floor_height, file_path, annotated_path)
+
+            # Show the original image until the annotated one is ready
+            display_image = url_for('static', filename='uploads/' + filename)
         else:
             display_image = None
+            job_id = None
 
         return render_template('draw.html',
                            floor_width=floor_width,
@@ -156,7 +520,8 @@ def index():
                            booth_width=booth_width,
                            booth_height=booth_height,
                            floorplan_title=floorplan_title,
-                           image_url=display_image)
+                           image_url=display_image,
+                           job_id=job_id)
     return render_template('index.html')
 
 if __name__ == '__main__':
@@ -110,6 +110,11 @@ function init() {
     };
     imageObj.src = imageUrl;
 
+    // Beacon placement renders in the background; swap in the annotated image when ready
+    if (renderJobId) {
+        pollRenderJob(renderJobId);
+    }
+
     canvas.addEventListener('mousemove', onMouseMove);
     canvas.addEventListener('click', onCanvasClick);
     
@@ -175,6 +180,47 @@ function drawGrid() {
     }
 }
 
+function showAnnotatedImage(url) {
+    // Before the upload has loaded, let the normal sizing code handle the annotated image
+    if (!imageLoaded) {
+        imageObj.src = url;
+        return;
+    }
+
+    // Keep the current canvas size and scale so booths/beacons already drawn stay in place;
+    // the annotated render can differ from the upload by a pixel or two
+    const annotated = new Image();
+    annotated.onload = function() {
+        imageObj = annotated;
+        drawCanvas();
+    };
+    annotated.src = url;
+}
+
+function pollRenderJob(jobId) {
+    const statusText = document.getElementById("renderStatus");
+
+    fetch(`/jobs/${jobId}`)
+        .then(response => response.json())
+        .then(job => {
+            if (job.status === "done") {
+                statusText.textContent = `Beacon placement ready (${job.beacon_count} beacons)`;
+                showAnnotatedImage(job.image_url);
+            } else if (job.status === "failed" || job.error) {
+                statusText.textContent = "Beacon placement failed: " + job.error;
+            } else {
+                statusText.textContent = job.status === "running"
+                    ? "Placing beacons..."
+                    : "Waiting for beacon placement...";
+                setTimeout(() => pollRenderJob(jobId), 1000);
+            }
+        })
+        .catch(error => {
+            console.error("Error polling render job:", error);
+            setTimeout(() => pollRenderJob(jobId), 3000);
+        });
+}
+
 function drawCanvas() {
     if (!ctx || !imageLoaded) return;
     